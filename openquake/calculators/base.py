@@ -1132,9 +1132,8 @@ def import_gmfs_csv(dstore, oqparam, sitecol):
         # there is a custom_site_id instead
         customs = sitecol.complete.custom_site_id
         to_sid = {csi: sid for sid, csi in enumerate(customs)}
-        for csi in numpy.unique(array['custom_site_id']):
-            ok = array['custom_site_id'] == csi
-            arr['sid'][ok] = to_sid[csi]
+        csis, inv = numpy.unique(array['custom_site_id'], return_inverse=True)
+        arr['sid'] = U32([to_sid[csi] for csi in csis])[inv]
 
     n = len(numpy.unique(arr[['sid', 'eid']]))
     if n != len(array):
@@ -1288,12 +1287,14 @@ def store_shakemap(calc, sitecol, shakemap, gmf_dict):
         events = numpy.zeros(E, rupture.events_dt)
         events['id'] = numpy.arange(E, dtype=U32)
         calc.datastore['events'] = events
-        # convert into an array of dtype gmv_data_dt
-        lst = [(sitecol.sids[s], ei) + tuple(gmfs[s, ei])
-               for ei, event in enumerate(events)
-               for s in numpy.arange(N, dtype=U32)]
+        # convert into an array of dtype gmv_data_dt, ordered by event
         oq.hazard_imtls = {str(imt): [0] for imt in imts}
-        data = numpy.array(lst, oq.gmf_data_dt())
+        data = numpy.zeros(E * N, oq.gmf_data_dt())
+        data['sid'] = numpy.tile(sitecol.sids, E)
+        data['eid'] = numpy.repeat(events['id'], N)
+        gmfs = gmfs.transpose(1, 0, 2).reshape(E * N, M)
+        for m in range(M):
+            data[f'gmv_{m}'] = gmfs[:, m]
         create_gmf_data(calc.datastore, imts, data=data)
 
 
@@ -133,12 +133,18 @@ def event_based(proxies, full_lt, oqparam, dstore, monitor):
         else:
             station_data = None
             station_sitecol = None
-        for proxy in proxies:
+        # prefilter all the ruptures at once, by magnitude and distance
+        with fmon:
+            recs = numpy.array([proxy.rec for proxy in proxies])
+            close = recs['mag'] >= cmaker.min_mag
+            # the site indices are generated lazily, in bounded chunks
+            allsids = srcfilter.batch_close_sids(recs[close])
+        for proxy, ok in zip(proxies, close):
+            if not ok:
+                continue
             t0 = time.time()
             with fmon:
-                if proxy['mag'] < cmaker.min_mag:
-                    continue
-                sids = srcfilter.close_sids(proxy, trt)
+                sids = next(allsids)
                 if len(sids) == 0:  # filtered away
                     continue
                 proxy.geom = rupgeoms[proxy['geom_id']]
@@ -155,20 +161,21 @@ def event_based(proxies, full_lt, oqparam, dstore, monitor):
             times.append((proxy['id'], len(computer.ctx.sids),
                           computer.ctx.rrup.min(), dt))
             for key in df.columns:
-                alldata[key].extend(df[key])
+                alldata[key].append(df[key].to_numpy())
     for key, val in sorted(alldata.items()):
         if key in 'eid sid rlz':
-            alldata[key] = U32(alldata[key])
+            alldata[key] = U32(numpy.concatenate(val))
         else:
-            alldata[key] = F32(alldata[key])
+            alldata[key] = F32(numpy.concatenate(val))
     gmfdata = strip_zeros(pandas.DataFrame(alldata))
     if len(gmfdata) and oqparam.hazard_curves_from_gmfs:
         hc_mon = monitor('building hazard curves', measuremem=False)
+        imtls = oqparam.imtls  # build the DictArray only once
         for (sid, rlz), df in gmfdata.groupby(['sid', 'rlz']):
             with hc_mon:
                 poes = calc.gmvs_to_poes(
-                    df, oqparam.imtls, oqparam.ses_per_logic_tree_path)
-                for m, imt in enumerate(oqparam.imtls):
+                    df, imtls, oqparam.ses_per_logic_tree_path)
+                for m, imt in enumerate(imtls):
                     hcurves[rsi2str(rlz, sid, imt)] = poes[m]
     times = numpy.array([tup + (monitor.task_no,) for tup in times], rup_dt)
     times.sort(order='rup_id')
@@ -22,6 +22,7 @@ from unittest.mock import Mock
 import numpy
 
 from openquake.baselib import performance, parallel, hdf5, general
+from openquake.baselib.performance import compile
 from openquake.hazardlib.source import rupture
 from openquake.hazardlib import probability_map
 from openquake.hazardlib.source.rupture import EBRupture, events_dt
@@ -78,6 +79,22 @@ def convert_to_array(pmap, nsites, imtls, inner_idx=0):
 
 # #########################  GMF->curves #################################### #
 
+# the compiled loop is faster than sorting when there are few gmvs
+MAX_LOOP = 10_000
+
+
+@compile(["float64[:](float32[:], float64[:], float64)",
+          "float64[:](float64[:], float64[:], float64)"])
+def _haz_curve(gmvs, imls, ses_per_logic_tree_path):
+    # count the gmvs exceeding each level with an explicit loop
+    num_exceeding = numpy.zeros(len(imls))
+    for gmv in gmvs:
+        for li, iml in enumerate(imls):
+            if gmv >= iml:
+                num_exceeding[li] += 1
+    return -numpy.expm1(-(num_exceeding / ses_per_logic_tree_path))
+
+
 # NB (MS): the approach used here will not work for non-poissonian models
 def _gmvs_to_haz_curve(gmvs, imls, ses_per_logic_tree_path):
     """
@@ -87,20 +104,24 @@ def _gmvs_to_haz_curve(gmvs, imls, ses_per_logic_tree_path):
     :param gmvs:
         Am array of ground motion values, as floats.
     :param imls:
-        A list of intensity measure levels, as floats.
+        An array of intensity measure levels, as float64.
     :param ses_per_logic_tree_path:
         Number of stochastic event sets: the larger, the best convergency
 
     :returns:
         Numpy array of PoEs (probabilities of exceedance).
     """
-    # convert to numpy array and redimension so that it can be broadcast with
-    # the gmvs for computing PoE values; there is a gmv for each rupture
-    # here is an example: imls = [0.03, 0.04, 0.05], gmvs=[0.04750576]
-    # => num_exceeding = [1, 1, 0] coming from 0.04750576 > [0.03, 0.04, 0.05]
-    imls = numpy.array(imls).reshape((len(imls), 1))
-    num_exceeding = numpy.sum(gmvs >= imls, axis=1)
-    poes = 1 - numpy.exp(- num_exceeding / ses_per_logic_tree_path)
+    if performance.numba and len(gmvs) * len(imls) < MAX_LOOP:
+        return _haz_curve(numpy.asarray(gmvs), imls, ses_per_logic_tree_path)
+    # count the gmvs exceeding each level by sorting the gmvs once, without
+    # building a boolean matrix of shape (L, E); there is a gmv for each
+    # rupture; here is an example: imls = [0.03, 0.04, 0.05],
+    # gmvs=[0.04750576] => num_exceeding = [1, 1, 0] coming from
+    # 0.04750576 >= [0.03, 0.04, 0.05]
+    gmvs = numpy.sort(gmvs)
+    num_exceeding = len(gmvs) - numpy.searchsorted(gmvs, imls, side='left')
+    # expm1 is more accurate than 1 - exp for small arguments
+    poes = -numpy.expm1(-(num_exceeding / ses_per_logic_tree_path))
     return poes
 
 
@@ -115,8 +136,10 @@ def gmvs_to_poes(df, imtls, ses_per_logic_tree_path):
     L = len(imtls[next(iter(imtls))])
     arr = numpy.zeros((M, L))
     for m, imt in enumerate(imtls):
+        # no copy if imtls is a DictArray, since its rows are float64
+        imls = numpy.asarray(imtls[imt], F64)
         arr[m] = _gmvs_to_haz_curve(
-            df[f'gmv_{m}'].to_numpy(), imtls[imt], ses_per_logic_tree_path)
+            df[f'gmv_{m}'].to_numpy(), imls, ses_per_logic_tree_path)
     return arr
 
 
@@ -158,10 +181,12 @@ def make_uhs(hmap, info):
         a composite array containing uniform hazard spectra
     """
     uhs = numpy.zeros(len(hmap), info['uhs_dt'])
-    for p, poe in enumerate(info['poes']):
-        for m, imt in enumerate(info['imtls']):
-            if imt.startswith(('PGA', 'SA')):
-                uhs['%.6f' % poe][imt] = hmap[:, m, p]
+    ms = [m for m, imt in enumerate(info['imtls'])
+          if imt.startswith(('PGA', 'SA'))]
+    if ms:
+        # all the fields are float32, so uhs can be seen as (N, P, M) array
+        view = uhs.view(F32).reshape(len(hmap), len(info['poes']), len(ms))
+        view[:] = numpy.asarray(hmap)[:, ms].transpose(0, 2, 1)
     return uhs
 
 
@@ -872,6 +872,23 @@ def check_same_levels(imtls):
     return periods, imls
 
 
+@functools.lru_cache()
+def _imt_dt(imts, dtype):
+    # cached, since it is called with the same IMTs many times;
+    # the IMTs are sorted here, as in OqParam.imtls
+    return numpy.dtype([(imt, dtype) for imt in sort_by_imt(
+        dict.fromkeys(imts))])
+
+
+@functools.lru_cache()
+def _uhs_dt(imts, poes):
+    # cached, since it is called with the same IMTs and poes many times;
+    # the IMTs are sorted here, as in OqParam.imtls
+    imts_dt = numpy.dtype([(imt, F32) for imt in sort_by_imt(
+        dict.fromkeys(imts)) if imt.startswith(('PGA', 'SA'))])
+    return numpy.dtype([('%.6f' % poe, imts_dt) for poe in poes])
+
+
 class OqParam(valid.ParamSet):
     _input_files = ()  # set in get_oqparam
 
@@ -1468,15 +1485,15 @@ class OqParam(valid.ParamSet):
         :returns: a vector of minimum intensities, one per IMT
         """
         mini = self.minimum_intensity
+        imtls = self.imtls
+        min_iml = numpy.full(len(imtls), 1E-10)
         if mini:
-            for imt in self.imtls:
-                try:
-                    mini[imt] = calc.filters.getdefault(mini, imt)
-                except KeyError:
-                    mini[imt] = 0
-        if 'default' in mini:
-            del mini['default']
-        min_iml = numpy.array([mini.get(imt) or 1E-10 for imt in self.imtls])
+            # fill the missing IMTs with the default, in a single pass
+            default = mini.pop('default', 0)
+            for m, imt in enumerate(imtls):
+                iml = mini.setdefault(imt, default)
+                if iml:
+                    min_iml[m] = iml
         return min_iml
 
     def get_max_iml(self):
@@ -1554,9 +1571,8 @@ class OqParam(valid.ParamSet):
         """
         :returns: a composity dtype (poe, imt)
         """
-        imts_dt = numpy.dtype([(imt, F32) for imt in self.imtls
-                               if imt.startswith(('PGA', 'SA'))])
-        return numpy.dtype([('%.6f' % poe, imts_dt) for poe in self.poes])
+        return _uhs_dt(tuple(self.hazard_imtls or self.risk_imtls),
+                       tuple(self.poes))
 
     def imt_periods(self):
         """
@@ -1573,7 +1589,7 @@ class OqParam(valid.ParamSet):
         """
         :returns: a numpy dtype {imt: float}
         """
-        return numpy.dtype([(imt, dtype) for imt in self.imtls])
+        return _imt_dt(tuple(self.hazard_imtls or self.risk_imtls), dtype)
 
     @property
     def lti(self):
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import numpy
 from openquake.baselib import general
 from openquake.hazardlib.sourceconverter import SourceConverter
@@ -64,3 +65,33 @@ class HazardMapsTestCase(unittest.TestCase):
         ]
         actual = compute_hazard_maps(numpy.array(curves), imls, poes)
         aaae(expected, actual.T)
+
+    def test_compute_hazard_map_zero_level(self):
+        # a zero level has logarithm -inf; a poe equal to a knot of the
+        # curve next to it must not produce a NaN
+        curves = numpy.array([[1.0, 0.5, 0.2]])
+        actual = compute_hazard_maps(curves, [0, 0.3, 0.6], [0.5, 0.2])
+        aaae([[0.3, 0.6]], actual)
+
+
+class GmvsToHazCurveTestCase(unittest.TestCase):
+
+    def test_loop_and_searchsorted(self):
+        from openquake.commonlib import calc
+        imls = numpy.logspace(-3, 0, 20)
+        rng = numpy.random.default_rng(42)
+        for E in (0, 1, calc.MAX_LOOP // len(imls) + 1):
+            for dt in (numpy.float32, numpy.float64):
+                gmvs = rng.lognormal(-2, 1, E).astype(dt)
+                n = min(E, 5)
+                gmvs[:n] = imls[:n]  # gmvs equal to the levels
+                # the original broadcast formula
+                num = (gmvs >= imls.reshape(-1, 1)).sum(axis=1)
+                expected = 1. - numpy.exp(-num / 10)
+                numpy.testing.assert_allclose(
+                    calc._haz_curve(gmvs, imls, 10), expected, rtol=1E-12)
+                for max_loop in (0, numpy.inf):  # searchsorted, loop
+                    with mock.patch.object(calc, 'MAX_LOOP', max_loop):
+                        numpy.testing.assert_allclose(
+                            calc._gmvs_to_haz_curve(gmvs, imls, 10),
+                            expected, rtol=1E-12)
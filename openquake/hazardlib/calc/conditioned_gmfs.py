@@ -257,31 +257,12 @@ class ConditionedGmfComputer(GmfComputer):
             n = 0
             for rlz in rlzs:
                 eids = eid_rlz[eid_rlz['rlz'] == rlz]['eid'][0] + offsets
-                for ei, eid in enumerate(eids):
-                    gmfa = array[:, :, n + ei]  # shape (N, M)
-                    if sig_eps is not None:
-                        tup = tuple([eid, rlz] + list(sig[:, n + ei]) +
-                                    list(eps[:, n + ei]))
-                        sig_eps.append(tup)
-                    items = []
-                    for sp in self.sec_perils:
-                        o = sp.compute(mag, zip(self.imts, gmfa.T), self.ctx)
-                        for outkey, outarr in zip(sp.outputs, o):
-                            items.append((outkey, outarr))
-                    for i, gmv in enumerate(gmfa):
-                        if gmv.sum() == 0:
-                            continue
-                        data["sid"].append(sids[i])
-                        data["eid"].append(eid)
-                        data["rlz"].append(rlz)  # used in compute_gmfs_curves
-                        for m in range(M):
-                            data[f"gmv_{m}"].append(gmv[m])
-                        for outkey, outarr in items:
-                            data[outkey].append(outarr[i])
-                        # gmv can be zero due to the minimum_intensity, coming
-                        # from the job.ini or from the vulnerability functions
+                slc = slice(n, n + len(eids))
+                self.update(data, array[:, :, slc], sig[:, slc],
+                            eps[:, slc], sids, eids, rlz, mag, sig_eps)
                 n += len(eids)
-        return pandas.DataFrame(data)
+        return pandas.DataFrame(
+            {key: numpy.concatenate(arrays) for key, arrays in data.items()})
 
     def compute(self, gsim, num_events, mean_covs, rng):
         """
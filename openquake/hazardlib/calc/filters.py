@@ -19,10 +19,10 @@
 import ast
 import sys
 import operator
+import itertools
 from contextlib import contextmanager
 import numpy
 from scipy.spatial import cKDTree
-from scipy.interpolate import interp1d
 
 from openquake.baselib.python3compat import raise_
 from openquake.hazardlib import site
@@ -33,9 +33,12 @@ from openquake.hazardlib.geo.utils import (
     get_longitudinal_extent, BBoxError, spherical_to_cartesian)
 
 U32 = numpy.uint32
+F32 = numpy.float32
+F64 = numpy.float64
 MINMAG = 2.5
 MAXMAG = 10.2  # to avoid breaking PAC
 MAX_DISTANCE = 2000  # km, ultra big distance used if there is no filter
+MAX_CELLS = 1_000_000  # max size of the (sources, sites) masks in filter
 trt_smr = operator.attrgetter('trt_smr')
 
 
@@ -91,6 +94,31 @@ def _distances_from_dcache(rup, sites, param, dcache):
     return distances
 
 
+def _closest_points(rup, sites):
+    t = rup.surface.get_closest_points(sites)
+    return numpy.vstack([t.lons, t.lats, t.depths]).T  # shape (N, 3)
+
+
+# dictionary param -> function (rupture, sites) -> distances, used to
+# avoid a long chain of string comparisons in get_distances
+_DIST_FUNCS = {
+    'rrup': lambda rup, sites: rup.surface.get_min_distance(sites),
+    'rx': lambda rup, sites: rup.surface.get_rx_distance(sites),
+    'ry0': lambda rup, sites: rup.surface.get_ry0_distance(sites),
+    'rjb': lambda rup, sites: rup.surface.get_joyner_boore_distance(sites),
+    'rhypo': lambda rup, sites: rup.hypocenter.distance_to_mesh(sites),
+    'repi': lambda rup, sites: rup.hypocenter.distance_to_mesh(
+        sites, with_depths=False),
+    'rcdpp': lambda rup, sites: rup.get_cdppvalue(sites),
+    'azimuth': lambda rup, sites: rup.surface.get_azimuth(sites),
+    'azimuth_cp': lambda rup, sites: (
+        rup.surface.get_azimuth_of_closest_point(sites)),
+    'closest_point': _closest_points,
+    # Volcanic distance not yet supported, defaulting to zero
+    'rvolc': lambda rup, sites: numpy.zeros(len(sites.lons), F32),
+}
+
+
 def get_distances(rupture, sites, param, dcache=None):
     """
     :param rupture: a rupture
@@ -105,32 +133,12 @@ def get_distances(rupture, sites, param, dcache=None):
             rupture, sites.complete, param, dcache)[sites.sids]
     if not rupture.surface:  # PointRupture
         dist = rupture.hypocenter.distance_to_mesh(sites)
-    elif param == 'rrup':
-        dist = rupture.surface.get_min_distance(sites)
-    elif param == 'rx':
-        dist = rupture.surface.get_rx_distance(sites)
-    elif param == 'ry0':
-        dist = rupture.surface.get_ry0_distance(sites)
-    elif param == 'rjb':
-        dist = rupture.surface.get_joyner_boore_distance(sites)
-    elif param == 'rhypo':
-        dist = rupture.hypocenter.distance_to_mesh(sites)
-    elif param == 'repi':
-        dist = rupture.hypocenter.distance_to_mesh(sites, with_depths=False)
-    elif param == 'rcdpp':
-        dist = rupture.get_cdppvalue(sites)
-    elif param == 'azimuth':
-        dist = rupture.surface.get_azimuth(sites)
-    elif param == 'azimuth_cp':
-        dist = rupture.surface.get_azimuth_of_closest_point(sites)
-    elif param == 'closest_point':
-        t = rupture.surface.get_closest_points(sites)
-        dist = numpy.vstack([t.lons, t.lats, t.depths]).T  # shape (N, 3)
-    elif param == "rvolc":
-        # Volcanic distance not yet supported, defaulting to zero
-        dist = numpy.zeros_like(sites.lons)
     else:
-        raise ValueError('Unknown distance measure %r' % param)
+        try:
+            func = _DIST_FUNCS[param]
+        except KeyError:
+            raise ValueError('Unknown distance measure %r' % param)
+        dist = func(rupture, sites)
     dist.flags.writeable = False
     return dist
 
@@ -198,13 +206,52 @@ def floatdict(value):
     return value
 
 
+class Piecewise(object):
+    """
+    Piecewise linear function, returning zero outside the range of the
+    abscissae. It is a lightweight replacement of
+    scipy.interpolate.interp1d(x, y, bounds_error=False, fill_value=0.),
+    with the same attributes .x and .y.
+
+    >>> f = Piecewise([4, 8], [50, 200])
+    >>> f(6)
+    125.0
+    >>> f([3, 4, 8, 9])
+    array([  0.,  50., 200.,   0.])
+    """
+    def __init__(self, x, y):
+        x = numpy.array(x, float)
+        y = numpy.array(y, float)
+        idx = numpy.argsort(x, kind='stable')
+        self.x = x[idx]
+        self.y = y[idx]
+        self.cache = {}  # x -> y
+
+    def __call__(self, x):
+        # numpy.interp performs a binary search on the sorted abscissae;
+        # scalar results are memoized, since the same magnitudes recur
+        # across the ruptures of a source
+        try:
+            return self.cache[x]
+        except KeyError:
+            y = self.cache[x] = numpy.interp(
+                x, self.x, self.y, left=0., right=0.)
+            return y
+        except TypeError:  # unhashable, i.e. an array or a list
+            return numpy.interp(x, self.x, self.y, left=0., right=0.)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__,
+                            list(zip(self.x, self.y)))
+
+
 def magdepdist(pairs):
     """
     :param pairs: a list of pairs [(mag, dist), ...]
-    :returns: a scipy.interpolate.interp1d function
+    :returns: a :class:`Piecewise` function
     """
     mags, dists = zip(*pairs)
-    return interp1d(mags, dists, bounds_error=False, fill_value=0.)
+    return Piecewise(mags, dists)
 
 
 def upper_maxdist(idist):
@@ -218,6 +265,10 @@ class IntegrationDistance(dict):
     """
     A dictionary trt -> [(mag, dist), ...]
     """
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._call_cache = {}  # trt -> Piecewise
+
     @classmethod
     def new(cls, value):
         """
@@ -272,7 +323,22 @@ class IntegrationDistance(dict):
                 self[trt] = magdists
 
     def __call__(self, trt):
-        return magdepdist(self[trt])
+        try:
+            return self._call_cache[trt]
+        except KeyError:
+            md = self._call_cache[trt] = magdepdist(self[trt])
+            return md
+
+    def __setitem__(self, trt, pairs):
+        # invalidate the cache; this is also called when unpickling
+        self._call_cache = {}
+        super().__setitem__(trt, pairs)
+
+    def __getstate__(self):
+        return {}  # do not pickle the cache
+
+    def __setstate__(self, state):
+        self._call_cache = {}
 
     def __missing__(self, trt):
         assert 'default' in self, 'missing "default" key in maximum_distance'
@@ -289,7 +355,7 @@ class IntegrationDistance(dict):
         :returns: min_lon, min_lat, max_lon, max_lat
         """
         if trt is None:  # take the greatest integration distance
-            maxdist = max(self.max().values())
+            maxdist = upper_maxdist(self)
         else:  # get the integration distance for the given TRT
             maxdist = self[trt][-1][1]
         a1 = min(maxdist * KM_TO_DEGREES, 90)
@@ -303,6 +369,40 @@ class IntegrationDistance(dict):
         return .01 + numpy.arange(nbins) * self(trt) / (nbins - 1)
 
 
+def _cross_idl(lons, bboxes):
+    # vectorized version of cross_idl(lons.min(), lons.max(), min_lon, max_lon)
+    l1 = numpy.minimum(lons.min(), bboxes[:, 0])
+    l2 = numpy.maximum(lons.max(), bboxes[:, 2])
+    return (l1 * l2 < 0) & (numpy.abs(l1 - l2) > 180)
+
+
+def within_bboxes(lons, lats, bboxes):
+    """
+    Vectorized version of SiteCollection.within_bbox working on many
+    bounding boxes at once.
+
+    :param lons: an array of N longitudes
+    :param lats: an array of N latitudes
+    :param bboxes: an array of shape (B, 4) with (min_lon, min_lat, max_lon,
+                   max_lat) for each bounding box
+    :returns: a boolean mask of shape (B, N)
+    """
+    min_lon, min_lat, max_lon, max_lat = bboxes.T
+    cross = _cross_idl(lons, bboxes)
+    mask = numpy.zeros((len(bboxes), len(lons)), bool)
+    for idl, lo in [(False, lons), (True, lons % 360)]:
+        rows, = numpy.where(cross == idl)
+        if len(rows) == 0:
+            continue
+        lo1, lo2 = min_lon[rows, None], max_lon[rows, None]
+        if idl:
+            lo1, lo2 = lo1 % 360, lo2 % 360
+        mask[rows] = ((lo1 < lo) & (lo < lo2) &
+                      (min_lat[rows, None] < lats) &
+                      (lats < max_lat[rows, None]))
+    return mask
+
+
 def split_source(src):
     """
     :param src: a splittable (or not splittable) source
@@ -346,14 +446,34 @@ class SourceFilter(object):
     """
     Filter objects have a .filter method yielding filtered sources
     and the IDs of the sites within the given maximum distance.
-    Filter the sources by using `self.sitecol.within_bbox` which is
-    based on numpy.
+    Filter the sources by using `within_bboxes` which is based on numpy.
     """
     def __init__(self, sitecol, integration_distance=default):
         self.sitecol = sitecol
         self.integration_distance = integration_distance
         self.slc = slice(None)  # TODO: check if we can remove this
 
+    def __getstate__(self):
+        # the coordinates are rebuilt lazily from the site collection
+        return {k: v for k, v in vars(self).items()
+                if k not in ('lons', 'lats')}
+
+    def _lonlat(self):
+        # contiguous copies of the coordinates used in the site queries
+        if not hasattr(self, 'lons'):
+            self.lons = numpy.ascontiguousarray(self.sitecol['lon'], F64)
+            self.lats = numpy.ascontiguousarray(self.sitecol['lat'], F64)
+        return self.lons, self.lats
+
+    def within_bboxes(self, bboxes):
+        """
+        :param bboxes: an array of shape (B, 4) of bounding boxes
+        :returns: a list of B arrays with the indices of the sites inside
+        """
+        bboxes = numpy.asarray(bboxes, float)
+        lons, lats = self._lonlat()
+        return [row.nonzero()[0] for row in within_bboxes(lons, lats, bboxes)]
+
     def reduce(self, multiplier=5):
         """
         Reduce the SourceFilter to a subset of sites
@@ -373,7 +493,7 @@ class SourceFilter(object):
         :returns: a bounding box (min_lon, min_lat, max_lon, max_lat)
         """
         if maxdist is None:
-            if hasattr(self.integration_distance, 'y'):  # interp1d
+            if hasattr(self.integration_distance, 'y'):  # Piecewise
                 maxdist = self.integration_distance.y[-1]
             else:
                 maxdist = getdefault(self.integration_distance,
@@ -443,7 +563,62 @@ class SourceFilter(object):
                 bbox = self.get_enlarged_box(src_or_rec, maxdist)
             except BBoxError:  # do not filter
                 return self.sitecol.sids
-            return self.sitecol.within_bbox(bbox)
+            return self.within_bboxes([bbox])[0]
+
+    def _xyz_dist(self, recs):
+        # vectorized computation of the query points and radii used in
+        # close_sids for rupture records
+        assert hasattr(self.integration_distance, 'x')
+        dlon = get_longitudinal_extent(recs['minlon'], recs['maxlon']) / 2.
+        dlat = (recs['maxlat'] - recs['minlat']) / 2.
+        dist = self.integration_distance(recs['mag']) + numpy.sqrt(
+            dlon**2 + dlat**2) / KM_TO_DEGREES
+        dist += 10  # buffer, see the comment in close_sids
+        if not hasattr(self, 'kdt'):
+            self.kdt = cKDTree(self.sitecol.xyz)
+        lon, lat, dep = recs['hypo'].T
+        return spherical_to_cartesian(lon, lat, dep), dist
+
+    def batch_close_sids(self, recs):
+        """
+        Vectorized version of `close_sids` for many rupture records.
+        The distances are computed all at once, while the KD-tree of the
+        sites is queried in chunks, to keep the memory bounded.
+
+        :param recs: an array of rupture records
+        :returns: an iterator over arrays of site indices, one per record
+        """
+        assert self.sitecol is not None
+        if not self.integration_distance:  # do not filter
+            return iter([self.sitecol.sids] * len(recs))
+        if len(recs) == 0:
+            return iter([])
+        xyz, dist = self._xyz_dist(recs)
+        return self._gen_sids(xyz, dist)
+
+    def _gen_sids(self, xyz, dist):
+        chunksize = max(1, MAX_CELLS // len(self.sitecol))
+        for start in range(0, len(dist), chunksize):
+            slc = slice(start, start + chunksize)
+            for lst in self.kdt.query_ball_point(xyz[slc], dist[slc],
+                                                 eps=.001):
+                sids = U32(lst)
+                sids.sort()
+                yield sids
+
+    def batch_num_close(self, recs):
+        """
+        :param recs: an array of rupture records
+        :returns: the number of sites close to each record
+        """
+        assert self.sitecol is not None
+        if not self.integration_distance:  # do not filter
+            return numpy.full(len(recs), len(self.sitecol))
+        if len(recs) == 0:
+            return numpy.zeros(0, int)
+        xyz, dist = self._xyz_dist(recs)
+        return self.kdt.query_ball_point(
+            xyz, dist, eps=.001, return_length=True)
 
     def _close_sids(self, lon, lat, dep, dist):
         if not hasattr(self, 'kdt'):
@@ -462,8 +637,34 @@ class SourceFilter(object):
             for src in sources:
                 yield src, None
             return
-        for src in sources:
-            sids = self.close_sids(src)
+        # the bounding boxes are computed and compared with the sites
+        # in blocks of sources, to keep the (sources, sites) mask small
+        blocksize = max(1, MAX_CELLS // len(self.sitecol))
+        sources = iter(sources)
+        while True:
+            block = list(itertools.islice(sources, blocksize))
+            if not block:
+                break
+            yield from self._filter_block(block)
+
+    def _filter_block(self, srcs):
+        if not self.integration_distance:  # do not filter
+            for src in srcs:
+                yield src, self.sitecol
+            return
+        bboxes = numpy.zeros((len(srcs), 4))
+        ok = numpy.ones(len(srcs), bool)
+        for i, src in enumerate(srcs):
+            try:
+                bboxes[i] = self.get_enlarged_box(src)
+            except BBoxError:  # do not filter
+                ok[i] = False
+        sids_iter = iter(self.within_bboxes(bboxes[ok]))
+        for src, good in zip(srcs, ok):
+            if not good:
+                yield src, self.sitecol
+                continue
+            sids = next(sids_iter)
             if len(sids):
                 yield src, self.sitecol.filtered(sids)
 
@@ -169,31 +169,52 @@ class GmfComputer(object):
             n = 0
             for rlz in rlzs:
                 eids = eid_rlz[eid_rlz['rlz'] == rlz]['eid']
-                for ei, eid in enumerate(eids):
-                    gmfa = array[:, :, n + ei]  # shape (N, M)
-                    if sig_eps is not None:
-                        tup = tuple([eid, rlz] + list(sig[:, n + ei]) +
-                                    list(eps[:, n + ei]))
-                        sig_eps.append(tup)
-                    items = []
-                    for sp in self.sec_perils:
-                        o = sp.compute(mag, zip(self.imts, gmfa.T), self.ctx)
-                        for outkey, outarr in zip(sp.outputs, o):
-                            items.append((outkey, outarr))
-                    for i, gmv in enumerate(gmfa):
-                        if gmv.sum() == 0:
-                            continue
-                        data['sid'].append(sids[i])
-                        data['eid'].append(eid)
-                        data['rlz'].append(rlz)  # used in compute_gmfs_curves
-                        for m in range(M):
-                            data[f'gmv_{m}'].append(gmv[m])
-                        for outkey, outarr in items:
-                            data[outkey].append(outarr[i])
-                        # gmv can be zero due to the minimum_intensity, coming
-                        # from the job.ini or from the vulnerability functions
+                slc = slice(n, n + len(eids))
+                self.update(data, array[:, :, slc], sig[:, slc],
+                            eps[:, slc], sids, eids, rlz, mag, sig_eps)
                 n += len(eids)
-        return pandas.DataFrame(data)
+        return pandas.DataFrame(
+            {key: numpy.concatenate(arrays) for key, arrays in data.items()})
+
+    def update(self, data, array, sig, eps, sids, eids, rlz, mag,
+               sig_eps=None):
+        """
+        Add the nonzero GMFs of a realization to `data`, a dictionary
+        of lists of arrays, in the order event by event and site by site.
+
+        :param array: an array of GMFs of shape (N, M, E)
+        :param sig: an array of shape (M, E)
+        :param eps: an array of shape (M, E)
+        :param sids: N site IDs
+        :param eids: E event IDs
+        :param rlz: the realization index
+        :param mag: the magnitude of the rupture
+        :param sig_eps: a list of tuples (eid, rlz, sig..., eps...) or None
+        """
+        N, M, E = array.shape
+        gmfs = array.transpose(2, 0, 1)  # shape (E, N, M)
+        if sig_eps is not None:
+            for ei, eid in enumerate(eids):
+                sig_eps.append(tuple([eid, rlz] + list(sig[:, ei]) +
+                                     list(eps[:, ei])))
+        outs = []  # pairs (outkey, array of shape (E, N))
+        for sp in self.sec_perils:
+            res = [sp.compute(mag, zip(self.imts, gmfs[ei].T), self.ctx)
+                   for ei in range(E)]
+            for o, outkey in enumerate(sp.outputs):
+                outs.append((outkey, numpy.array([r[o] for r in res])))
+        # gmv can be zero due to the minimum_intensity, coming
+        # from the job.ini or from the vulnerability functions
+        eis, idxs = (gmfs.sum(axis=2) != 0).nonzero()
+        if len(eis) == 0:
+            return
+        data['sid'].append(sids[idxs])
+        data['eid'].append(eids[eis])
+        data['rlz'].append(numpy.full(len(eis), rlz))  # used in gmfs_curves
+        for m in range(M):
+            data[f'gmv_{m}'].append(gmfs[eis, idxs, m])
+        for outkey, outarr in outs:
+            data[outkey].append(outarr[eis, idxs])
 
     def compute(self, gsim, num_events, mean_stds):
         """
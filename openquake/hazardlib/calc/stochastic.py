@@ -52,8 +52,14 @@ def get_rup_array(ebruptures, srcfilter=nofilter):
     if not BaseRupture._code:
         BaseRupture.init()  # initialize rupture codes
 
+    # apply magnitude filtering before building the records
+    mags = numpy.array([ebr.rupture.mag for ebr in ebruptures])
+    if len(mags) == 0:
+        return ()
+    ebruptures = [ebr for ebr, ok in zip(
+        ebruptures, srcfilter.integration_distance(mags) != 0) if ok]
     rups = []
-    geoms = []
+    meshes = []
     for ebrupture in ebruptures:
         rup = ebrupture.rupture
         arrays = surface_to_arrays(rup.surface)  # one array per surface
@@ -73,51 +79,46 @@ def get_rup_array(ebruptures, srcfilter=nofilter):
             points.append(array.flat)
         lons = numpy.concatenate(lons)
         lats = numpy.concatenate(lats)
-        points = F32(numpy.concatenate(points))
-        shapes = U32(shapes)
         hypo = rup.hypocenter.x, rup.hypocenter.y, rup.hypocenter.z
-        rec = numpy.zeros(1, rupture_dt)[0]
-        rec['id'] = ebrupture.id
-        rec['seed'] = ebrupture.seed
-        rec['minlon'] = minlon = numpy.nanmin(lons)  # NaNs are in KiteSurfaces
-        rec['minlat'] = minlat = numpy.nanmin(lats)
-        rec['maxlon'] = maxlon = numpy.nanmax(lons)
-        rec['maxlat'] = maxlat = numpy.nanmax(lats)
-        rec['mag'] = rup.mag
-        rec['hypo'] = hypo
-
-        # apply magnitude filtering
-        if srcfilter.integration_distance(rup.mag) == 0:
-            continue
-
-        # apply distance filtering
-        if srcfilter.sitecol is not None and len(
-                srcfilter.close_sids(rec, rup.tectonic_region_type)) == 0:
-            continue
-
+        minlon = numpy.nanmin(lons)  # NaNs are in KiteSurfaces
+        minlat = numpy.nanmin(lats)
+        maxlon = numpy.nanmax(lons)
+        maxlat = numpy.nanmax(lats)
         rate = getattr(rup, 'occurrence_rate', numpy.nan)
         tup = (ebrupture.id, ebrupture.seed, ebrupture.source_id,
                ebrupture.trt_smr, rup.code, ebrupture.n_occ, rup.mag, rup.rake,
                rate, minlon, minlat, maxlon, maxlat, hypo, 0, 0)
         rups.append(tup)
-        # we are storing the geometries as arrays of 32 bit floating points;
-        # the first element is the number of surfaces, then there are
-        # 2 * num_surfaces integers describing the first and second
-        # dimension of each surface, and then the lons, lats and deps of
-        # the underlying meshes of points; in event_based/case_1 there
-        # is a point source, i.e. planar surfaces, with shapes = [1, 4]
-        # and points.reshape(3, 4) containing lons, lats and depths;
-        # in classical/case_29 there is a non parametric source containing
-        # 2 KiteSurfaces with shapes=[8, 5, 8, 5] and 240 = 3*2*8*5 coordinates
-        # NB: the geometries are read by source.rupture.to_arrays
-        geom = numpy.concatenate([[len(shapes) // 2], shapes, points])
-        geoms.append(geom)
+        meshes.append((shapes, points))
     if not rups:
         return ()
+    arr = numpy.array(rups, rupture_dt)
+
+    # apply distance filtering to all the ruptures at once
+    if srcfilter.sitecol is not None:
+        ok = srcfilter.batch_num_close(arr) > 0
+        if not ok.any():
+            return ()
+        arr = arr[ok]
+        meshes = [mesh for mesh, good in zip(meshes, ok) if good]
+
+    # we are storing the geometries as arrays of 32 bit floating points;
+    # the first element is the number of surfaces, then there are
+    # 2 * num_surfaces integers describing the first and second
+    # dimension of each surface, and then the lons, lats and deps of
+    # the underlying meshes of points; in event_based/case_1 there
+    # is a point source, i.e. planar surfaces, with shapes = [1, 4]
+    # and points.reshape(3, 4) containing lons, lats and depths;
+    # in classical/case_29 there is a non parametric source containing
+    # 2 KiteSurfaces with shapes=[8, 5, 8, 5] and 240 = 3*2*8*5 coordinates
+    # NB: the geometries are read by source.rupture.to_arrays
+    geoms = []
+    for shapes, points in meshes:
+        geoms.append(numpy.concatenate(
+            [[len(shapes) // 2], U32(shapes), F32(numpy.concatenate(points))]))
     dic = dict(geom=numpy.array(geoms, object))
     # NB: PMFs for nonparametric ruptures are not saved since they
     # are useless for the GMF computation
-    arr = numpy.array(rups, rupture_dt)
     return hdf5.ArrayWrapper(arr, dic)
 
 
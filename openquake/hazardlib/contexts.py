@@ -27,7 +27,6 @@ import collections
 from unittest.mock import patch
 import numpy
 import shapely
-from scipy.interpolate import interp1d
 
 from openquake.baselib.general import (
     AccumDict, DictArray, RecordBuilder, split_in_slices, block_splitter,
@@ -743,6 +742,12 @@ class ContextMaker(object):
 
         return ctx
 
+    def _get_magdist(self, src):
+        # compute the maximum distances for all magnitudes at once
+        mags = [mag for mag, rate in src.get_annual_occurrence_rates()]
+        dists = self.maximum_distance(numpy.array(mags))
+        return dict(zip(mags, dists))
+
     def gen_ctxs_planar(self, src, sitecol):
         """
         :param src: a (Collapsed)PointSource
@@ -777,8 +782,7 @@ class ContextMaker(object):
             # building planar geometries
             planardict = src.get_planar(self.shift_hypo)
 
-        magdist = {mag: self.maximum_distance(mag)
-                   for mag, rate in src.get_annual_occurrence_rates()}
+        magdist = self._get_magdist(src)
         # self.maximum_distance(mag) can be 0 if outside the mag range
         maxmag = max(mag for mag, dist in magdist.items() if dist > 0)
         maxdist = magdist[maxmag]
@@ -1075,8 +1079,7 @@ class ContextMaker(object):
         :param sites: a filtered SiteCollection
         :returns: how many sites are impacted overall
         """
-        magdist = {mag: self.maximum_distance(mag)
-                   for mag, rate in src.get_annual_occurrence_rates()}
+        magdist = self._get_magdist(src)
         nphc = src.count_nphc()
         dists = sites.get_cdist(src.location)
         planardict = src.get_planar(iruptures=True)
@@ -1603,7 +1606,11 @@ class Effect(object):
             elif intensity > intensities.max():
                 dst[mag] = self.dists[0]  # smallest distance
             else:
-                dst[mag] = interp1d(intensities, self.dists)(intensity)
+                # numpy.interp requires increasing abscissae, while the
+                # intensities are decreasing with the distance
+                idx = numpy.argsort(intensities, kind='stable')
+                dst[mag] = numpy.interp(
+                    intensity, intensities[idx], self.dists[idx])
         return dst
 
 
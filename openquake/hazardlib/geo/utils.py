@@ -406,7 +406,7 @@ def get_bounding_box(obj, maxdist):
 
     :param obj:
         an object with method .get_bounding_box, or with an attribute .polygon
-        or a list of locations
+        or a list of locations or a mesh
     :param maxdist: maximum distance in km
     """
     if hasattr(obj, 'get_bounding_box'):
@@ -417,6 +417,8 @@ def get_bounding_box(obj, maxdist):
         if isinstance(obj, list):  # a list of locations
             lons = numpy.array([loc.longitude for loc in obj])
             lats = numpy.array([loc.latitude for loc in obj])
+        elif hasattr(obj, 'lons'):  # a mesh
+            lons, lats = numpy.array(obj.lons), obj.lats
         else:  # assume an array with fields lon, lat
             lons, lats = obj['lon'], obj['lat']
         min_lon, max_lon = lons.min(), lons.max()
@@ -18,6 +18,7 @@
 import math
 import copy
 import warnings
+import functools
 import numpy
 import pandas
 from openquake.baselib.general import cached_property
@@ -159,6 +160,18 @@ class ProbabilityCurve(object):
 EPSILON = 1E-30
 
 
+@functools.lru_cache(maxsize=16)
+def _log_array(values):
+    # cached logarithm of a tuple of floats, since compute_hazard_maps is
+    # typically called many times with the same levels and poes
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        # avoid RuntimeWarning: divide by zero for zero levels
+        arr = numpy.log(numpy.array(values, float))
+    arr.flags.writeable = False
+    return arr
+
+
 def compute_hazard_maps(curves, imls, poes):
     """
     Given a set of hazard curve poes, interpolate hazard maps at the specified
@@ -185,27 +198,46 @@ def compute_hazard_maps(curves, imls, poes):
         raise ValueError('The curves have %d levels, %d were passed' %
                          (L, len(imls)))
 
-    log_poes = numpy.log(poes)
+    log_poes = _log_array(tuple(poes))
+    imls = _log_array(tuple(imls[::-1]))
     hmap = numpy.zeros((N, P))
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        # avoid RuntimeWarning: divide by zero for zero levels
-        imls = numpy.log(numpy.array(imls[::-1]))
-    for n, curve in enumerate(curves):
-        # the hazard curve, having replaced the too small poes with EPSILON
-        log_curve = numpy.log([max(poe, EPSILON) for poe in curve[::-1]])
-        for p, log_poe in enumerate(log_poes):
-            if log_poe > log_curve[-1]:
-                # special case when the interpolation poe is bigger than the
-                # maximum, i.e the iml must be smaller than the minimum;
-                # extrapolate the iml to zero as per
-                # https://bugs.launchpad.net/oq-engine/+bug/1292093;
-                # then the hmap goes automatically to zero
-                pass
-            else:
-                # exp-log interpolation, to reduce numerical errors
-                # see https://bugs.launchpad.net/oq-engine/+bug/1252770
-                hmap[n, p] = numpy.exp(numpy.interp(log_poe, log_curve, imls))
+    # the hazard curves, having replaced the too small poes with EPSILON
+    log_curves = numpy.log(numpy.maximum(curves[:, ::-1], EPSILON))
+    # exp-log interpolation, to reduce numerical errors
+    # see https://bugs.launchpad.net/oq-engine/+bug/1252770;
+    # the interpolation is performed for all curves at once, with the same
+    # conventions of numpy.interp, by finding for each curve the index of
+    # the first level strictly above the poe, i.e. a vectorized searchsorted
+    # with side='right'; the loop is on the poes, which are very few
+    for p, log_poe in enumerate(log_poes):
+        idx = (log_curves <= log_poe).sum(axis=1)
+        j = numpy.clip(idx - 1, 0, max(L - 2, 0))[:, None]
+        x0 = numpy.take_along_axis(log_curves, j, axis=1)[:, 0]
+        x1 = numpy.take_along_axis(
+            log_curves, numpy.minimum(j + 1, L - 1), axis=1)[:, 0]
+        y0 = imls[j[:, 0]]
+        y1 = imls[numpy.minimum(j[:, 0] + 1, L - 1)]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            slope = (y1 - y0) / (x1 - x0)
+            vals = slope * (log_poe - x0) + y0
+            # the same fallbacks of numpy.interp, needed when a level
+            # is zero, i.e. when y1 is -inf: avoid -inf * 0 = nan
+            vals = numpy.where(log_poe == x0, y0, vals)
+            nan = numpy.isnan(vals)
+            if nan.any():
+                vals[nan] = (slope * (log_poe - x1) + y1)[nan]
+                nan = numpy.isnan(vals) & (y0 == y1)
+                vals[nan] = y0[nan]
+        vals[idx == 0] = imls[0]
+        vals[idx == L] = imls[-1]
+        # special case when the interpolation poe is bigger than the
+        # maximum, i.e the iml must be smaller than the minimum;
+        # extrapolate the iml to zero as per
+        # https://bugs.launchpad.net/oq-engine/+bug/1292093;
+        # then the hmap goes automatically to zero; in that case vals is
+        # imls[-1], the log of the smallest level, possibly -inf for a zero
+        # level: since exp(-inf) = 0 multiplying by the mask is safe
+        hmap[:, p] = numpy.exp(vals) * (log_poe <= log_curves[:, -1])
     return hmap
 
 
@@ -112,7 +112,8 @@ class MultiPointSource(ParametricSeismicSource):
         Bounding box containing all the point sources, enlarged by the
         maximum distance.
         """
-        return utils.get_bounding_box([ps.location for ps in self], maxdist)
+        # use the mesh, without instantiating the point sources
+        return utils.get_bounding_box(self.mesh, maxdist)
 
     @property
     def polygon(self):
@@ -16,14 +16,18 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 import os
+import pickle
 import unittest
+import numpy
 from numpy.testing import assert_almost_equal as aae
 from openquake.baselib.general import gettemp
 from openquake.hazardlib import nrml
 from openquake.hazardlib.geo.point import Point
 from openquake.hazardlib.site import Site, SiteCollection
+from openquake.hazardlib.source.rupture import rupture_dt
 from openquake.hazardlib.calc.filters import (
-    IntegrationDistance, SourceFilter, angular_distance, split_source)
+    IntegrationDistance, SourceFilter, angular_distance, split_source,
+    within_bboxes)
 
 
 class AngularDistanceTestCase(unittest.TestCase):
@@ -44,6 +48,38 @@ class IntegrationDistanceTestCase(unittest.TestCase):
         interp = maxdist('default')
         aae(interp([5, 6, 7, 7.2, 8]), [200., 200., 200.,   0.,   0.])
 
+    def test_cache(self):
+        maxdist = IntegrationDistance.new('[(4., 50), (8., 200.)]')
+        interp = maxdist('default')
+        self.assertIs(maxdist('default'), interp)
+        self.assertEqual(interp(6.), 125.)
+        self.assertEqual(interp(6.), 125.)  # from the cache
+        maxdist.cut({'default': 5.})  # invalidates the cache
+        self.assertIsNot(maxdist('default'), interp)
+        aae(maxdist('default')([4.5, 6.]), [0., 125.])
+        new = pickle.loads(pickle.dumps(maxdist))
+        self.assertEqual(new, maxdist)
+        self.assertEqual(new._call_cache, {})
+
+
+class WithinBBoxesTestCase(unittest.TestCase):
+    def test(self):
+        lons = numpy.array([179.5, -179.5, 170.])
+        lats = numpy.array([0., 0., 0.])
+        bboxes = numpy.array([[179., -1., 181., 1.],  # crossing the IDL
+                              [169., -1., 171., 1.],
+                              [20., 20., 30., 30.]])
+        sc = SiteCollection.from_points(lons, lats)
+        mask = within_bboxes(lons, lats, bboxes)
+        for bbox, row in zip(bboxes, mask):
+            numpy.testing.assert_equal(
+                row.nonzero()[0], sc.within_bbox(bbox))
+        numpy.testing.assert_equal(mask.sum(axis=1), [2, 1, 0])
+        # the SourceFilter method gives the same
+        sf = SourceFilter(sc, IntegrationDistance.new('100'))
+        for row, sids in zip(mask, sf.within_bboxes(bboxes)):
+            numpy.testing.assert_equal(row.nonzero()[0], sids)
+
 
 class SourceFilterTestCase(unittest.TestCase):
 
@@ -60,6 +96,34 @@ class SourceFilterTestCase(unittest.TestCase):
         sites = srcfilter.get_close_sites(src)
         self.assertIsNotNone(sites)
 
+    def test_batch_close_sids(self):
+        sitecol = SiteCollection.from_points([0., 1., 2.], [0., 0., 0.])
+        maxdist = IntegrationDistance.new('[(5, 20), (7, 200)]')
+        srcfilter = SourceFilter(sitecol, maxdist('default'))
+        recs = numpy.zeros(3, rupture_dt)
+        recs['mag'] = [5., 7., 7.]
+        recs['minlon'] = recs['maxlon'] = [0., 0., 3.]
+        recs['hypo'][:, 0] = [0., 0., 3.]
+        recs['hypo'][:, 2] = 10.
+        sids = srcfilter.batch_close_sids(recs)
+        for rec, expected in zip(recs, [[0], [0, 1], [2]]):
+            numpy.testing.assert_equal(srcfilter.close_sids(rec, '*'),
+                                       expected)
+        for got, expected in zip(sids, [[0], [0, 1], [2]]):
+            numpy.testing.assert_equal(got, expected)
+        numpy.testing.assert_equal(srcfilter.batch_num_close(recs),
+                                   [1, 2, 1])
+
+    def test_pickle(self):
+        # the site coordinates are not pickled, but rebuilt lazily
+        sitecol = SiteCollection.from_points([0., 1., 2.], [0., 0., 0.])
+        srcfilter = SourceFilter(sitecol, IntegrationDistance.new('100'))
+        bboxes = [[-.5, -.5, 1.5, .5]]
+        expected = srcfilter.within_bboxes(bboxes)
+        srcfilter = pickle.loads(pickle.dumps(srcfilter))
+        self.assertFalse(hasattr(srcfilter, 'lons'))
+        numpy.testing.assert_equal(srcfilter.within_bboxes(bboxes), expected)
+
 
 # from https://groups.google.com/d/msg/openquake-users/P03SxJsfW_s/nCdcxj8WAAAJ
 characteric_source = '''\